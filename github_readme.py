@@ -1,8 +1,15 @@
 # server.py
 import os
+import re
+import copy
+import time
 import fnmatch
+import functools
+import threading
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from mcp.server.fastmcp import FastMCP
 
 # Create an MCP server
@@ -15,82 +22,322 @@ IGNORE_PATTERNS = [
     ".idea", "*.sqlite", "*.db", "dist", "build", ".pytest_cache"
 ]
 
-def should_ignore(path: str) -> bool:
-    """Check if a file/folder should be ignored based on common patterns"""
-    name = os.path.basename(path)
-    for pattern in IGNORE_PATTERNS:
-        if fnmatch.fnmatch(name, pattern):
-            return True
-    return False
+# Scan top-level subdirectories in parallel only when there are more than this many
+PARALLEL_SCAN_MIN_DIRS = 4
 
-def get_file_info(file_path: Path) -> Dict[str, Any]:
-    """Get information about a file"""
+# Columns of the per-file information in analysis["files"], stored as one list
+# per column (struct of arrays) rather than a dict per file
+FILE_COLUMNS = ("name", "path", "size", "is_file", "extension")
+
+# Key files to look for
+KEY_FILES_PATTERNS = {
+    "readme": ["README.md", "README.txt", "README.rst", "readme.md"],
+    "license": ["LICENSE", "LICENSE.txt", "LICENSE.md", "license"],
+    "config": ["package.json", "requirements.txt", "setup.py", "Cargo.toml", 
+              "composer.json", "pom.xml", "build.gradle", "Gemfile"],
+    "docker": ["Dockerfile", "docker-compose.yml", "docker-compose.yaml"],
+    "ci": [".github/workflows", ".gitlab-ci.yml", ".travis.yml"],
+    "env": [".env.example", ".env.sample"]
+}
+
+# Lowercased filename -> (category, rank of the pattern within its category);
+# directory patterns are matched separately
+_KEY_FILE_INDEX = {
+    p.lower(): (category, rank)
+    for category, patterns in KEY_FILES_PATTERNS.items()
+    for rank, p in enumerate(patterns)
+    if "/" not in p
+}
+
+# Lowercased config filename -> build system, reported as analysis["build_system"]
+_BUILD_SYSTEM_BY_FILE = {
+    "package.json": "npm",
+    "requirements.txt": "pip",
+    "cargo.toml": "cargo",
+}
+
+# When several build systems are detected, the first of these wins
+_BUILD_SYSTEM_PRIORITY = ("npm", "pip", "cargo")
+
+# File extensions used to detect programming languages
+_LANG_EXTS = frozenset({'.py', '.js', '.ts', '.java', '.cpp', '.c', '.go', '.rs', '.rb', '.php'})
+
+# Static README fragments
+_TEMPLATE_USAGE = "## Usage\n\nDescribe how to use your project here.\n\n"
+
+_TEMPLATE_CONTRIBUTING = (
+    "## Contributing\n\n"
+    "1. Fork the repository\n"
+    "2. Create your feature branch (`git checkout -b feature/AmazingFeature`)\n"
+    "3. Commit your changes (`git commit -m 'Add some AmazingFeature'`)\n"
+    "4. Push to the branch (`git push origin feature/AmazingFeature`)\n"
+    "5. Open a Pull Request\n\n"
+)
+
+_TEMPLATE_LICENSE = (
+    "## License\n\n"
+    "This project is licensed under the terms found in the LICENSE file.\n\n"
+)
+
+# Installation instructions by detected build system
+_INSTALL_BY_BUILD = {
+    "npm": "```bash\nnpm install\n```\n\n",
+    "pip": "```bash\npip install -r requirements.txt\n```\n\n",
+    "cargo": "```bash\ncargo build\n```\n\n",
+}
+
+_DEFAULT_INSTALL = "Add installation instructions here.\n\n"
+
+# Projects with more files than this get no Project Structure section
+_STRUCTURE_MAX_FILES = 20
+
+# Cached analyses expire after at most this many seconds, so changes below the
+# project root (which don't touch the root's mtime) are picked up
+ANALYSIS_CACHE_TTL = 10
+ANALYSIS_CACHE_SIZE = 32
+
+# Cached analyses, least recently used first
+_ANALYSIS_CACHE: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+_ANALYSIS_CACHE_LOCK = threading.Lock()
+
+# All ignore patterns compiled once into a single alternation
+_IGNORE_RE = re.compile("|".join("(?:%s)" % fnmatch.translate(p) for p in IGNORE_PATTERNS))
+
+@functools.lru_cache(maxsize=4096)
+def should_ignore(name: str) -> bool:
+    """Check if a file/folder name should be ignored based on common patterns"""
+    return _IGNORE_RE.match(name) is not None
+
+# Patterns that can only name files; directories are not matched against them
+_FILE_ONLY_PATTERNS = frozenset({"*.pyc", ".gitignore", ".DS_Store"})
+_IGNORE_DIR_RE = re.compile("|".join(
+    "(?:%s)" % fnmatch.translate(p) for p in IGNORE_PATTERNS if p not in _FILE_ONLY_PATTERNS))
+
+# Separate memo so the few, highly repetitive directory names aren't
+# evicted by the mostly unique file names
+@functools.lru_cache(maxsize=1024)
+def _ignore_dir(name: str) -> bool:
+    """Check if a directory should be pruned from the walk"""
+    return _IGNORE_DIR_RE.match(name) is not None
+
+def _extension(name: str) -> str:
+    """File extension like Path.suffix: empty for dotfiles and names ending in a dot"""
+    dot = name.rfind('.')
+    return name[dot:] if 0 < dot < len(name) - 1 else ''
+
+def get_file_info(entry: os.DirEntry,
+                  extension: Optional[str] = None) -> Tuple[str, str, Optional[int], Optional[bool], str]:
+    """Get information about a file as a row of FILE_COLUMNS (size and is_file are None if it can't be stat'ed)"""
+    name = entry.name
+    if extension is None:
+        extension = _extension(name)
     try:
-        stat = file_path.stat()
-        return {
-            "name": file_path.name,
-            "path": str(file_path),
-            "size": stat.st_size,
-            "is_file": file_path.is_file(),
-            "extension": file_path.suffix
-        }
+        return (name, entry.path, entry.stat().st_size, entry.is_file(), extension)
     except (OSError, PermissionError):
-        return {"name": file_path.name, "path": str(file_path), "error": "Access denied"}
+        return (name, entry.path, None, None, extension)
 
-def analyze_project_structure(project_path: str, max_depth: int = 3) -> Dict[str, Any]:
-    """Analyze project structure and identify key files"""
-    project_root = Path(project_path)
+def _new_files() -> Dict[str, list]:
+    """Empty column store for file information, one list per FILE_COLUMNS entry"""
+    return {column: [] for column in FILE_COLUMNS}
+
+def _row(files: Dict[str, list], i: int) -> Dict[str, Any]:
+    """Rebuild the per-file dict for row i of a column store"""
+    if files["size"][i] is None:
+        return {"name": files["name"][i], "path": files["path"][i], "error": "Access denied"}
+    return {column: files[column][i] for column in FILE_COLUMNS}
+
+def clear_analysis_cache() -> None:
+    """Drop all cached project analyses so the next call rescans"""
+    with _ANALYSIS_CACHE_LOCK:
+        _ANALYSIS_CACHE.clear()
+
+def _recorded_capacity(early_stop: Optional[int], collect_files: bool) -> float:
+    """How many files an analysis with these options records at most"""
+    if not collect_files:
+        return 0
+    return float("inf") if early_stop is None else early_stop
+
+def _cache_lookup(base_key: tuple, needed: float) -> Optional[Dict[str, Any]]:
+    """Find a cached analysis of the same tree that recorded at least as many files"""
+    with _ANALYSIS_CACHE_LOCK:
+        for key in reversed(_ANALYSIS_CACHE):
+            if key[:-2] == base_key and _recorded_capacity(*key[-2:]) >= needed:
+                _ANALYSIS_CACHE.move_to_end(key)
+                return _ANALYSIS_CACHE[key]
+    return None
+
+def _cache_store(key: tuple, structure: Dict[str, Any]) -> None:
+    with _ANALYSIS_CACHE_LOCK:
+        _ANALYSIS_CACHE[key] = structure
+        while len(_ANALYSIS_CACHE) > ANALYSIS_CACHE_SIZE:
+            _ANALYSIS_CACHE.popitem(last=False)
+
+def analyze_project_structure(project_path: str, max_depth: int = 3,
+                              early_stop: Optional[int] = None,
+                              collect_files: bool = True) -> Dict[str, Any]:
+    """Analyze project structure and identify key files
     
-    if not project_root.exists():
+    early_stop caps the recorded files (setting "truncated"); collect_files=False
+    records none and only "file_count" reports them. Results are cached for up to
+    ANALYSIS_CACHE_TTL seconds; clear_analysis_cache() forces a rescan.
+    """
+    try:
+        root_stat = os.stat(project_path)
+    except OSError:
         return {"error": f"Project path '{project_path}' does not exist"}
     
+    base_key = (project_path, os.path.abspath(project_path), max_depth,
+                root_stat.st_mtime_ns, int(time.monotonic() // ANALYSIS_CACHE_TTL))
+    # A cached scan that recorded more files also answers narrower requests,
+    # e.g. a full scan_project serves the following generate_readme
+    needed = _recorded_capacity(early_stop, collect_files)
+    structure = _cache_lookup(base_key, needed)
+    if structure is None:
+        structure = _analyze(project_path, max_depth, early_stop, collect_files)
+        _cache_store(base_key + (early_stop, collect_files), structure)
+    elif needed < len(structure["files"]["path"]):
+        limit = int(needed)
+        structure = dict(structure,
+                         files={c: v[:limit] for c, v in structure["files"].items()},
+                         truncated=structure["truncated"] or collect_files)
+    # Hand out a copy so callers can't mutate the cached result
+    return copy.deepcopy(structure)
+
+def _scan_dir(dir_path: str, depth: int, max_depth: int, early_stop: Optional[int],
+              collect_files: bool, out: Dict[str, Any]) -> List[str]:
+    """Record the files of a single directory and return the subdirectories to descend into"""
+    try:
+        with os.scandir(dir_path) as it:
+            entries = list(it)
+    except OSError:
+        return []
+    
+    subdirs = []
+    file_entries = []
+    found = {}
+    for entry in entries:
+        if entry.is_dir():
+            # Prune ignored directories before they are ever opened, and don't
+            # follow symlinked ones out of the project tree
+            if _ignore_dir(entry.name) or entry.is_symlink():
+                continue
+            if entry.name == "workflows" and os.path.basename(dir_path) == ".github":
+                found["ci"] = (0, entry.name, entry.path)
+            if depth < max_depth:
+                subdirs.append(entry.path)
+        elif not should_ignore(entry.name):
+            file_entries.append(entry)
+    
+    extensions = [_extension(entry.name) for entry in file_entries]
+    
+    seen = out["file_count"]
+    out["file_count"] += len(file_entries)
+    
+    # Past early_stop, keep walking for languages and key files but stop
+    # recording (and stat'ing) files
+    recorded = len(file_entries) if collect_files else 0
+    if collect_files and early_stop is not None and out["file_count"] > early_stop:
+        out["truncated"] = True
+        recorded = max(early_stop - seen, 0)
+    
+    # One extend per column and directory rather than an append per file
+    rows = [get_file_info(entry, extension)
+            for entry, extension in zip(file_entries[:recorded], extensions[:recorded])]
+    for column, values in zip(FILE_COLUMNS, zip(*rows)):
+        out["files"][column].extend(values)
+    
+    for entry, extension in zip(file_entries, extensions):
+        # Detect programming languages
+        ext = extension.lower()
+        if ext in _LANG_EXTS:
+            out["languages"].add(ext[1:])
+        
+        # Check for key files
+        lower_name = entry.name.lower()
+        hit = _KEY_FILE_INDEX.get(lower_name)
+        if hit:
+            category, rank = hit
+            candidate = (rank, entry.name, entry.path)
+            if category not in found or candidate < found[category]:
+                found[category] = candidate
+            build_system = _BUILD_SYSTEM_BY_FILE.get(lower_name)
+            if build_system:
+                out["build_systems"].add(build_system)
+    
+    # Shallower directories win; within a directory the pattern order decides,
+    # so the result doesn't depend on scandir's order
+    for category, (_, _, path) in found.items():
+        out["key_files"].setdefault(category, path)
+    
+    subdirs.sort()
+    return subdirs
+
+def _scan_tree(dir_path: str, depth: int, max_depth: int, early_stop: Optional[int],
+               collect_files: bool, out: Dict[str, Any]) -> None:
+    """Walk a directory tree top-down (files before subdirectories, like os.walk)"""
+    for subdir in _scan_dir(dir_path, depth, max_depth, early_stop, collect_files, out):
+        _scan_tree(subdir, depth + 1, max_depth, early_stop, collect_files, out)
+
+def _scan_subtree(dir_path: str, depth: int, max_depth: int, early_stop: Optional[int],
+                  collect_files: bool) -> Dict[str, Any]:
+    """Walk a subtree into a fresh partial result (used by the worker threads)"""
+    partial = {"files": _new_files(), "file_count": 0, "languages": set(), "key_files": {},
+               "build_systems": set(), "truncated": False}
+    _scan_tree(dir_path, depth, max_depth, early_stop, collect_files, partial)
+    return partial
+
+def _analyze(project_path: str, max_depth: int, early_stop: Optional[int],
+             collect_files: bool) -> Dict[str, Any]:
+    """Walk the project tree and build the analysis (uncached)"""
+    project_root = Path(project_path)
+    
     structure = {
         "root": str(project_root),
-        "files": [],
+        "files": _new_files(),
+        "file_count": 0,
         "directories": [],
         "key_files": {},
+        "build_systems": set(),
         "languages": set(),
-        "framework_indicators": []
-    }
-    
-    # Key files to look for
-    key_files_patterns = {
-        "readme": ["README.md", "README.txt", "README.rst", "readme.md"],
-        "license": ["LICENSE", "LICENSE.txt", "LICENSE.md", "license"],
-        "config": ["package.json", "requirements.txt", "setup.py", "Cargo.toml", 
-                  "composer.json", "pom.xml", "build.gradle", "Gemfile"],
-        "docker": ["Dockerfile", "docker-compose.yml", "docker-compose.yaml"],
-        "ci": [".github/workflows", ".gitlab-ci.yml", ".travis.yml"],
-        "env": [".env.example", ".env.sample"]
+        "framework_indicators": [],
+        "truncated": False
     }
     
     # Walk through directory structure
-    for root, dirs, files in os.walk(project_root):
-        current_depth = len(Path(root).relative_to(project_root).parts)
-        if current_depth > max_depth:
-            continue
-            
-        # Filter out ignored directories
-        dirs[:] = [d for d in dirs if not should_ignore(os.path.join(root, d))]
+    subdirs = _scan_dir(str(project_root), 0, max_depth, early_stop, collect_files, structure)
+    
+    if len(subdirs) > PARALLEL_SCAN_MIN_DIRS:
+        # Overlap the readdir/stat round-trips of the top-level subtrees;
+        # os.scandir and stat release the GIL while waiting on the kernel
+        workers = min(8, (os.cpu_count() or 1) * 2)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            partials = list(pool.map(
+                lambda d: _scan_subtree(d, 1, max_depth, early_stop, collect_files), subdirs))
         
-        for file in files:
-            file_path = Path(root) / file
-            if should_ignore(str(file_path)):
-                continue
-                
-            file_info = get_file_info(file_path)
-            structure["files"].append(file_info)
-            
-            # Detect programming languages
-            ext = file_path.suffix.lower()
-            if ext in ['.py', '.js', '.ts', '.java', '.cpp', '.c', '.go', '.rs', '.rb', '.php']:
-                structure["languages"].add(ext[1:])
-            
-            # Check for key files
-            for category, patterns in key_files_patterns.items():
-                for pattern in patterns:
-                    if file.lower() == pattern.lower() or file == pattern:
-                        structure["key_files"][category] = str(file_path)
+        # Merge in submission order so the result matches a serial walk
+        for partial in partials:
+            for column, values in partial["files"].items():
+                structure["files"][column].extend(values)
+            structure["file_count"] += partial["file_count"]
+            structure["languages"].update(partial["languages"])
+            structure["build_systems"].update(partial["build_systems"])
+            structure["truncated"] |= partial["truncated"]
+            for category, path in partial["key_files"].items():
+                structure["key_files"].setdefault(category, path)
+        
+        # Each worker applies early_stop to its own subtree; cap the merged total
+        if early_stop is not None and len(structure["files"]["path"]) > early_stop:
+            for values in structure["files"].values():
+                del values[early_stop:]
+            structure["truncated"] = True
+    else:
+        for subdir in subdirs:
+            _scan_tree(subdir, 1, max_depth, early_stop, collect_files, structure)
+    
+    # Pick by fixed priority so the result doesn't depend on scandir order
+    build_systems = structure.pop("build_systems")
+    structure["build_system"] = next(
+        (b for b in _BUILD_SYSTEM_PRIORITY if b in build_systems), None)
     
     structure["languages"] = list(structure["languages"])
     return structure
@@ -98,7 +345,14 @@ def analyze_project_structure(project_path: str, max_depth: int = 3) -> Dict[str
 @mcp.tool()
 def scan_project(project_path: str) -> Dict[str, Any]:
     """Scan a project directory and analyze its structure"""
-    return analyze_project_structure(project_path)
+    analysis = analyze_project_structure(project_path)
+    if "error" in analysis:
+        return analysis
+    
+    # Clients get one dict per file, not the internal column store
+    files = analysis["files"]
+    analysis["files"] = [_row(files, i) for i in range(len(files["path"]))]
+    return analysis
 
 @mcp.tool()
 def read_file(file_path: str) -> str:
@@ -121,8 +375,9 @@ def read_file(file_path: str) -> str:
 def generate_readme(project_path: str, project_name: str = None, description: str = None) -> str:
     """Generate a comprehensive README.md for a project"""
     
-    # Analyze project structure
-    analysis = analyze_project_structure(project_path)
+    # Analyze project structure, recording only as many files as the
+    # Project Structure section can show
+    analysis = analyze_project_structure(project_path, early_stop=_STRUCTURE_MAX_FILES)
     
     if "error" in analysis:
         return f"Error: {analysis['error']}"
@@ -132,62 +387,50 @@ def generate_readme(project_path: str, project_name: str = None, description: st
         project_name = Path(project_path).name
     
     # Start building README content
-    readme_content = f"# {project_name}\n\n"
+    parts = [f"# {project_name}\n\n"]
     
     # Add description
     if description:
-        readme_content += f"{description}\n\n"
+        parts.append(f"{description}\n\n")
     else:
-        readme_content += "A brief description of your project.\n\n"
+        parts.append("A brief description of your project.\n\n")
     
     # Add languages/technologies section
     if analysis["languages"]:
-        readme_content += "## Technologies Used\n\n"
-        for lang in sorted(analysis["languages"]):
-            readme_content += f"- {lang.upper()}\n"
-        readme_content += "\n"
+        parts.append("## Technologies Used\n\n")
+        parts.extend(f"- {lang.upper()}\n" for lang in sorted(analysis["languages"]))
+        parts.append("\n")
     
     # Add installation section
-    readme_content += "## Installation\n\n"
+    parts.append("## Installation\n\n")
     
     # Provide installation instructions based on detected files
-    if "package.json" in str(analysis.get("key_files", {})):
-        readme_content += "```bash\nnpm install\n```\n\n"
-    elif "requirements.txt" in str(analysis.get("key_files", {})):
-        readme_content += "```bash\npip install -r requirements.txt\n```\n\n"
-    elif "Cargo.toml" in str(analysis.get("key_files", {})):
-        readme_content += "```bash\ncargo build\n```\n\n"
-    else:
-        readme_content += "Add installation instructions here.\n\n"
+    parts.append(_INSTALL_BY_BUILD.get(analysis["build_system"], _DEFAULT_INSTALL))
     
     # Add usage section
-    readme_content += "## Usage\n\n"
-    readme_content += "Describe how to use your project here.\n\n"
+    parts.append(_TEMPLATE_USAGE)
     
     # Add project structure if it's not too complex
-    if len(analysis["files"]) <= 20:
-        readme_content += "## Project Structure\n\n"
-        readme_content += "```\n"
-        for file_info in sorted(analysis["files"], key=lambda x: x["path"]):
-            if file_info.get("is_file", True):
-                rel_path = Path(file_info["path"]).relative_to(analysis["root"])
-                readme_content += f"{rel_path}\n"
-        readme_content += "```\n\n"
+    if not analysis["truncated"]:
+        files = analysis["files"]
+        paths = files["path"]
+        parts.append("## Project Structure\n\n")
+        parts.append("```\n")
+        parts.extend(
+            f"{Path(paths[i]).relative_to(analysis['root'])}\n"
+            for i in sorted(range(len(paths)), key=paths.__getitem__)
+            if files["is_file"][i] is not False
+        )
+        parts.append("```\n\n")
     
     # Add contributing section
-    readme_content += "## Contributing\n\n"
-    readme_content += "1. Fork the repository\n"
-    readme_content += "2. Create your feature branch (`git checkout -b feature/AmazingFeature`)\n"
-    readme_content += "3. Commit your changes (`git commit -m 'Add some AmazingFeature'`)\n"
-    readme_content += "4. Push to the branch (`git push origin feature/AmazingFeature`)\n"
-    readme_content += "5. Open a Pull Request\n\n"
+    parts.append(_TEMPLATE_CONTRIBUTING)
     
     # Add license section if license file exists
     if "license" in analysis.get("key_files", {}):
-        readme_content += "## License\n\n"
-        readme_content += "This project is licensed under the terms found in the LICENSE file.\n\n"
+        parts.append(_TEMPLATE_LICENSE)
     
-    return readme_content
+    return "".join(parts)
 
 @mcp.tool()
 def save_readme(project_path: str, readme_content: str) -> str:
@@ -204,13 +447,14 @@ def save_readme(project_path: str, readme_content: str) -> str:
 @mcp.resource("project://{project_path}")
 def get_project_info(project_path: str) -> str:
     """Get comprehensive project information"""
-    analysis = analyze_project_structure(project_path)
+    # Only counts are reported, so skip recording (and stat'ing) every file
+    analysis = analyze_project_structure(project_path, collect_files=False)
     
     if "error" in analysis:
         return f"Error analyzing project: {analysis['error']}"
     
     info = f"Project Analysis for: {analysis['root']}\n"
-    info += f"Total files: {len(analysis['files'])}\n"
+    info += f"Total files: {analysis['file_count']}\n"
     info += f"Languages detected: {', '.join(analysis['languages'])}\n"
     info += f"Key files found: {', '.join(analysis['key_files'].keys())}\n"
     